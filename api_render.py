@@ -1,60 +1,172 @@
 import os
-import psycopg2
-from fastapi import FastAPI, Request, HTTPException, status
-from pydantic import BaseModel, EmailStr
+import hashlib
+from functools import lru_cache
+from fastapi import FastAPI, Query, Request, Response, HTTPException, status
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import sqlalchemy
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from datetime import datetime
-import json
+import orjson
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
 # --- Configurações do Banco PostgreSQL ---
 
+@lru_cache(maxsize=1)
 def get_database_url():
     """
     Constrói a URL do banco de dados a partir das variáveis de ambiente.
+    O resultado é calculado uma única vez e reaproveitado.
     """
+    environ = os.environ
+    
     # Tentar usar DATABASE_URL primeiro (mais simples)
-    database_url = os.getenv("DATABASE_URL")
+    database_url = environ.get("DATABASE_URL")
     if database_url:
         return database_url
     
     # Senão, construir a partir das variáveis individuais
-    host = os.getenv("POSTGRES_HOST")
-    port = os.getenv("POSTGRES_PORT", "5432")
-    database = os.getenv("POSTGRES_DB")
-    user = os.getenv("POSTGRES_USER")
-    password = os.getenv("POSTGRES_PASSWORD")
+    host = environ.get("POSTGRES_HOST")
+    port = environ.get("POSTGRES_PORT", "5432")
+    database = environ.get("POSTGRES_DB")
+    user = environ.get("POSTGRES_USER")
+    password = environ.get("POSTGRES_PASSWORD")
     
     if not all([host, database, user, password]):
         raise ValueError("Configurações de banco de dados incompletas!")
     
     return f"postgresql://{user}:{password}@{host}:{port}/{database}"
 
+# Engine compartilhada por toda a aplicação (criada uma única vez no lifespan)
+_engine: AsyncEngine | None = None
+
 def get_database_engine():
     """
-    Cria a engine de conexão com o PostgreSQL do Render.
+    Cria a engine assíncrona (asyncpg) de conexão com o PostgreSQL do Render.
     """
     database_url = get_database_url()
-    engine = create_engine(
+    # O Render fornece URLs "postgres://" ou "postgresql://"; usar o driver asyncpg
+    for prefix in ("postgres://", "postgresql://"):
+        if database_url.startswith(prefix):
+            database_url = "postgresql+asyncpg://" + database_url[len(prefix):]
+            break
+    engine = create_async_engine(
         database_url,
         pool_pre_ping=True,  # Verificar conexões antes de usar
         pool_recycle=300,    # Reciclar conexões a cada 5 minutos
+        pool_size=10,        # Conexões mantidas abertas no pool
+        max_overflow=20,     # Conexões extras em picos de carga
+        json_deserializer=orjson.loads,  # Codec JSONB do asyncpg decodifica com orjson
     )
     return engine
 
-def create_db_and_tables():
+# --- Dados JSON adicionais (constantes, serializados uma única vez) ---
+
+WEBHOOK_USER_DATA = orjson.dumps({
+    "created_via": "webhook",
+    "source": "api",
+    "ip_address": "unknown"  # Você pode capturar o IP real se necessário
+}).decode()
+
+WEBHOOK_BATCH_USER_DATA = orjson.dumps({
+    "created_via": "webhook_batch",
+    "source": "api",
+    "ip_address": "unknown"
+}).decode()
+
+# --- Consultas SQL (montadas uma única vez na importação do módulo) ---
+
+# O timestamp do user_data é gerado pelo próprio PostgreSQL (mesmo valor de created_at)
+INSERT_USER_SQL = text("""
+    INSERT INTO users (username, email, user_data) 
+    VALUES (
+        :username, :email,
+        CAST(:user_data AS JSONB) || jsonb_build_object('timestamp', CURRENT_TIMESTAMP)
+    )
+    RETURNING id, created_at
+""")
+
+# Inserção em lote: um único comando com arrays (unnest) para N usuários
+INSERT_USERS_BATCH_SQL = text("""
+    INSERT INTO users (username, email, user_data)
+    SELECT
+        new_user.username, new_user.email,
+        CAST(:user_data AS JSONB) || jsonb_build_object('timestamp', CURRENT_TIMESTAMP)
+    FROM unnest(
+        CAST(:usernames AS VARCHAR[]),
+        CAST(:emails AS VARCHAR[])
+    ) AS new_user(username, email)
+    RETURNING id, email, created_at
+""")
+
+_LIST_USERS_TEMPLATE = """
+    SELECT 
+        id, username, email,
+        COALESCE(user_data, CAST('{{}}' AS JSONB)) AS user_data, status,
+        created_at, updated_at
+    FROM users
+    {where_clause}
+    ORDER BY created_at DESC, id DESC
+    LIMIT :limit
+"""
+
+def _build_list_users_sql(with_status: bool, with_cursor: bool):
+    """
+    Monta a query de listagem paginada por cursor (keyset).
+    """
+    conditions = []
+    if with_status:
+        conditions.append("status = :status_filter")
+    if with_cursor:
+        conditions.append("(created_at, id) < (:after_created_at, :after_id)")
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return text(_LIST_USERS_TEMPLATE.format(where_clause=where_clause))
+
+# Uma query por combinação de (filtro de status, cursor)
+LIST_USERS_SQL = {
+    (with_status, with_cursor): _build_list_users_sql(with_status, with_cursor)
+    for with_status in (False, True)
+    for with_cursor in (False, True)
+}
+
+# Projeta apenas as colunas retornadas + updated_at para o ETag (evita ler o JSONB)
+SELECT_USER_SQL = text("SELECT id, username, updated_at FROM users WHERE id = :user_id")
+
+# Texto fixo: campos não informados (NULL) mantêm o valor atual
+UPDATE_USER_SQL = text("""
+    UPDATE users 
+    SET username = COALESCE(:username, username),
+        email = COALESCE(:email, email),
+        status = COALESCE(:status, status),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = :user_id
+    RETURNING id, username, email, status, updated_at
+""")
+
+SOFT_DELETE_USER_SQL = text("""
+    UPDATE users 
+    SET status = 'deleted', updated_at = CURRENT_TIMESTAMP
+    WHERE id = :user_id AND status != 'deleted'
+    RETURNING id, username, email
+""")
+
+# version() é constante: lida uma vez no startup; o health check faz só um ping
+DB_VERSION_SQL = text("SELECT version()")
+
+HEALTH_CHECK_SQL = text("SELECT 1")
+
+async def create_db_and_tables():
     """
     Cria a tabela de usuários se não existir.
     """
-    engine = get_database_engine()
-    
     try:
-        with engine.connect() as connection:
+        async with _engine.connect() as connection:
             # Criar tabela de usuários com suporte a JSON
             create_table_sql = """
                 CREATE TABLE IF NOT EXISTS users (
@@ -63,25 +175,52 @@ def create_db_and_tables():
                     email VARCHAR(255) NOT NULL UNIQUE,
                     user_data JSONB DEFAULT '{}',
                     status VARCHAR(20) DEFAULT 'active',
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
                 )
             """
             
-            connection.execute(text(create_table_sql))
+            await connection.execute(text(create_table_sql))
+            
+            # created_at é a chave do cursor da listagem: não pode ser NULL.
+            # Tabelas antigas foram criadas com a coluna anulável; o ALTER (lock
+            # ACCESS EXCLUSIVE) só roda se ainda for necessário
+            result = await connection.execute(text(
+                "SELECT attnotnull FROM pg_attribute "
+                "WHERE attrelid = 'users'::regclass AND attname = 'created_at'"
+            ))
+            if not result.scalar():
+                await connection.execute(text(
+                    "UPDATE users SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP) "
+                    "WHERE created_at IS NULL"
+                ))
+                await connection.execute(text(
+                    "ALTER TABLE users ALTER COLUMN created_at SET NOT NULL"
+                ))
+            
+            # Confirmar a tabela antes dos índices para não manter o lock durante os builds
+            await connection.commit()
             
             # Criar índices para performance
             indices_sql = [
                 "CREATE INDEX IF NOT EXISTS idx_users_email ON users(email)",
-                "CREATE INDEX IF NOT EXISTS idx_users_status ON users(status)",
-                "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)",
-                "CREATE INDEX IF NOT EXISTS idx_users_data_gin ON users USING GIN(user_data)"
+                # Índices para a listagem paginada (ORDER BY created_at DESC, id DESC);
+                # idx_users_status_created_id também atende filtros só por status
+                "CREATE INDEX IF NOT EXISTS idx_users_created_id_desc ON users(created_at DESC, id DESC)",
+                "CREATE INDEX IF NOT EXISTS idx_users_status_created_id ON users(status, created_at DESC, id DESC)",
+                "DROP INDEX IF EXISTS idx_users_created_at",
+                "DROP INDEX IF EXISTS idx_users_status",
+                # jsonb_path_ops: índice menor e mais barato de manter (atende consultas @>);
+                # o novo é construído antes de remover o antigo
+                "CREATE INDEX IF NOT EXISTS idx_users_data_path_ops ON users USING GIN(user_data jsonb_path_ops)",
+                "DROP INDEX IF EXISTS idx_users_data_gin"
             ]
             
+            # Uma transação por comando: o lock exclusivo de um DROP não fica
+            # preso durante o build dos demais índices
             for index_sql in indices_sql:
-                connection.execute(text(index_sql))
-            
-            connection.commit()
+                await connection.execute(text(index_sql))
+                await connection.commit()
             print("✅ Tabela 'users' e índices criados/verificados com sucesso!")
                 
     except Exception as e:
@@ -93,9 +232,14 @@ async def lifespan(app: FastAPI):
     """
     Gerencia o ciclo de vida da aplicação.
     """
+    global _engine
     print("🚀 Iniciando a aplicação e configurando o PostgreSQL (Render)...")
     try:
-        create_db_and_tables()
+        _engine = get_database_engine()
+        await create_db_and_tables()
+        async with _engine.connect() as connection:
+            result = await connection.execute(DB_VERSION_SQL)
+            app.state.db_version = result.scalar() or "unknown"
         print("✅ Banco de dados configurado com sucesso!")
     except Exception as e:
         print(f"❌ Erro na configuração do banco: {e}")
@@ -103,6 +247,10 @@ async def lifespan(app: FastAPI):
     
     yield
     print("🛑 Finalizando a aplicação.")
+    # Fechar as conexões do pool para liberar os backends no PostgreSQL
+    if _engine is not None:
+        await _engine.dispose()
+        _engine = None
 
 # --- Modelos de Dados com Pydantic ---
 
@@ -113,13 +261,85 @@ class UserWebhook(BaseModel):
     username: str
     email: EmailStr
 
+class UserBatch(BaseModel):
+    """
+    Modelo para cadastro de vários usuários em uma única requisição.
+    """
+    users: list[UserWebhook] = Field(min_length=1, max_length=500)
+
+    @field_validator("users")
+    @classmethod
+    def check_duplicate_emails(cls, users: list[UserWebhook]):
+        """
+        Rejeita lotes com o mesmo e-mail repetido (seria violação de UNIQUE no INSERT).
+        """
+        seen = set()
+        duplicates = []
+        for user in users:
+            if user.email in seen and user.email not in duplicates:
+                duplicates.append(user.email)
+            seen.add(user.email)
+        if duplicates:
+            raise ValueError(f"E-mails repetidos no lote: {', '.join(duplicates)}")
+        return users
+
 class UserUpdate(BaseModel):
     """
     Modelo para atualização de dados do usuário.
     """
-    username: str = None
-    email: EmailStr = None
-    status: str = None
+    username: str | None = None
+    email: EmailStr | None = None
+    status: str | None = None
+
+# --- Decodificação do corpo JSON com orjson ---
+
+class ORJSONRequest(Request):
+    """
+    Request que decodifica o corpo JSON com orjson em vez do json da stdlib.
+    """
+    async def json(self):
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+class ORJSONRoute(APIRoute):
+    """
+    Rota que entrega um ORJSONRequest para o handler do FastAPI.
+    """
+    def get_route_handler(self):
+        original_route_handler = super().get_route_handler()
+
+        async def orjson_route_handler(request: Request):
+            request = ORJSONRequest(request.scope, request.receive)
+            return await original_route_handler(request)
+
+        return orjson_route_handler
+
+# --- ETag (respostas condicionais com 304 Not Modified) ---
+
+def make_etag(*parts):
+    """
+    Gera um ETag curto a partir dos valores que identificam a versão do recurso.
+    """
+    digest = hashlib.blake2b(
+        ":".join(str(part) for part in parts).encode(),
+        digest_size=8
+    ).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(request: Request, etag: str):
+    """
+    Verifica se o ETag informado em If-None-Match corresponde ao atual.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag
+        for tag in if_none_match.split(",")
+    )
 
 # --- Configuração da Aplicação FastAPI ---
 
@@ -127,47 +347,33 @@ app = FastAPI(
     title="Api com Render PostgreSQL",
     description="API para cadastrar usuarios e armazenar dados no PostgreSQL (Render)",
     version="1.0.0",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
+app.router.route_class = ORJSONRoute
 
 # --- Endpoints da API ---
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {
         "message": "API Paulo Moreno PostgreSQL (Render)",
            }
 
 @app.post("/new-user", status_code=status.HTTP_201_CREATED)
-def receive_user_webhook(user_data: UserWebhook):
+async def receive_user_webhook(user_data: UserWebhook):
     """
     Cadastrar um novo usuário e salvar no PostgreSQL.
     """
-    engine = get_database_engine()
-    
     try:
-        with engine.connect() as connection:
-            # Preparar dados JSON adicionais
-            additional_data = {
-                "created_via": "webhook",
-                "source": "api",
-                "timestamp": datetime.now().isoformat(),
-                "ip_address": "unknown"  # Você pode capturar o IP real se necessário
-            }
-            
+        async with _engine.connect() as connection:
             # Inserir dados do usuário
-            insert_sql = """
-                INSERT INTO users (username, email, user_data) 
-                VALUES (:username, :email, :user_data)
-                RETURNING id, created_at
-            """
-            
-            result = connection.execute(
-                text(insert_sql),
+            result = await connection.execute(
+                INSERT_USER_SQL,
                 {
                     "username": user_data.username,
                     "email": user_data.email,
-                    "user_data": json.dumps(additional_data)
+                    "user_data": WEBHOOK_USER_DATA
                 }
             )
             
@@ -175,7 +381,7 @@ def receive_user_webhook(user_data: UserWebhook):
             user_id = row[0]
             created_at = row[1]
             
-            connection.commit()
+            await connection.commit()
             
     except sqlalchemy.exc.IntegrityError as e:
         if "unique constraint" in str(e).lower():
@@ -204,69 +410,138 @@ def receive_user_webhook(user_data: UserWebhook):
         }
     }
 
+@app.post("/new-users", status_code=status.HTTP_201_CREATED)
+async def receive_users_batch(batch: UserBatch):
+    """
+    Cadastrar vários usuários de uma vez (um único INSERT) no PostgreSQL.
+    """
+    try:
+        async with _engine.connect() as connection:
+            # Inserir todos os usuários em um único round-trip
+            result = await connection.execute(
+                INSERT_USERS_BATCH_SQL,
+                {
+                    "usernames": [user.username for user in batch.users],
+                    "emails": [user.email for user in batch.users],
+                    "user_data": WEBHOOK_BATCH_USER_DATA
+                }
+            )
+            
+            rows = result.fetchall()
+            
+            await connection.commit()
+            
+    except sqlalchemy.exc.IntegrityError as e:
+        if "unique constraint" in str(e).lower():
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Um ou mais e-mails do lote já estão cadastrados."
+            )
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Erro de integridade: {str(e)}"
+            )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro interno do servidor: {str(e)}"
+        )
+
+    return {
+        "message": f"{len(rows)} usuários recebidos e salvos com sucesso no Render!",
+        "users": [
+            {
+                "user_id": row[0],
+                "email": row[1],
+                "created_at": row[2].isoformat() if row[2] else None
+            }
+            for row in rows
+        ]
+    }
+
 # ...existing code...
 
 @app.get("/users")
-def list_users(limit: int = 10, offset: int = 0, status_filter: str = None):
+async def list_users(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100),
+    after_created_at: datetime | None = None,
+    after_id: int | None = None,
+    status_filter: str | None = None
+):
     """
-    Endpoint para listar usuários com paginação e filtros.
+    Endpoint para listar usuários com paginação por cursor e filtros.
     """
-    engine = get_database_engine()
-    
     try:
-        with engine.connect() as connection:
-            # Construir query com filtros opcionais
-            where_clause = ""
-            params = {"limit": limit, "offset": offset}
+        if (after_created_at is None) != (after_id is None):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Informe 'after_created_at' e 'after_id' juntos para paginar."
+            )
+        
+        async with _engine.connect() as connection:
+            # Buscar um registro a mais para saber se existe próxima página
+            params = {"limit": limit + 1}
             
             if status_filter:
-                where_clause = "WHERE status = :status_filter"
                 params["status_filter"] = status_filter
             
-            # Query com paginação
-            query_sql = f"""
-                SELECT 
-                    id, username, email, user_data, status,
-                    created_at, updated_at
-                FROM users
-                {where_clause}
-                ORDER BY created_at DESC
-                LIMIT :limit OFFSET :offset
-            """
+            if after_id is not None:
+                params["after_created_at"] = after_created_at
+                params["after_id"] = after_id
+            
+            query_sql = LIST_USERS_SQL[(bool(status_filter), after_id is not None)]
+            result = await connection.execute(query_sql, params)
+            rows = result.fetchall()
             
-            result = connection.execute(text(query_sql), params)
+            has_more = len(rows) > limit
+            rows = rows[:limit]
             
-            users = []
-            for row in result:
-                # Correção: verificar se user_data já é dict ou precisa ser convertido
-                user_data = row[3] if isinstance(row[3], dict) else (json.loads(row[3]) if row[3] else {})
-                users.append({
+            # ETag da página: ids e updated_at dos registros retornados
+            etag = make_etag(has_more, *(f"{row[0]}@{row[6]}" for row in rows))
+            if etag_matches(request, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            
+            # JSONB nunca é NULL (COALESCE) e já chega como dict pelo codec do driver;
+            # datetimes são serializados direto pelo orjson (sem isoformat() por linha)
+            users = [
+                {
                     "id": row[0],
                     "username": row[1],
                     "email": row[2],
-                    "additional_data": user_data,
+                    "additional_data": row[3],
                     "status": row[4],
-                    "created_at": row[5].isoformat() if row[5] else None,
-                    "updated_at": row[6].isoformat() if row[6] else None
-                })
-            
-            # Contar total de usuários
-            count_sql = f"SELECT COUNT(*) FROM users {where_clause}"
-            count_params = {k: v for k, v in params.items() if k not in ['limit', 'offset']}
-            count_result = connection.execute(text(count_sql), count_params)
-            total = count_result.fetchone()[0]
+                    "created_at": row[5],
+                    "updated_at": row[6]
+                }
+                for row in rows
+            ]
             
-            return {
-                "users": users,
-                "pagination": {
-                    "total": total,
-                    "limit": limit,
-                    "offset": offset,
-                    "has_more": (offset + limit) < total,
-                    "pages": (total + limit - 1) // limit  # Calcular total de páginas
+            # Cursor para a próxima página (último registro retornado)
+            next_cursor = None
+            if has_more:
+                last_row = rows[-1]
+                next_cursor = {
+                    "after_created_at": last_row[5],
+                    "after_id": last_row[0]
                 }
-            }
             
+            # Resposta montada direto com orjson, sem passar pelo jsonable_encoder
+            return ORJSONResponse(
+                content={
+                    "users": users,
+                    "pagination": {
+                        "limit": limit,
+                        "has_more": has_more,
+                        "next_cursor": next_cursor
+                    }
+                },
+                headers={"ETag": etag}
+            )
+            
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -274,24 +549,13 @@ def list_users(limit: int = 10, offset: int = 0, status_filter: str = None):
         )
 
 @app.get("/users/{user_id}")
-def get_user_by_id(user_id: int):
+async def get_user_by_id(user_id: int, request: Request, response: Response):
     """
     Buscar usuário específico por ID.
     """
-    engine = get_database_engine()
-    
     try:
-        with engine.connect() as connection:
-            result = connection.execute(
-                text("""
-                    SELECT 
-                        id, username, email, user_data, status,
-                        created_at, updated_at
-                    FROM users 
-                    WHERE id = :user_id
-                """),
-                {"user_id": user_id}
-            )
+        async with _engine.connect() as connection:
+            result = await connection.execute(SELECT_USER_SQL, {"user_id": user_id})
             
             row = result.fetchone()
             if not row:
@@ -300,13 +564,17 @@ def get_user_by_id(user_id: int):
                     detail=f"Usuário com ID {user_id} não encontrado."
                 )
             
-            # Correção: verificar se user_data já é dict ou precisa ser convertido
-            user_data = row[3] if isinstance(row[3], dict) else (json.loads(row[3]) if row[3] else {})
+            etag = make_etag(row[0], row[2])
+            if etag_matches(request, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+            response.headers["ETag"] = etag
+            
+            # Ao reativar o retorno completo, voltar a projetar todas as colunas em SELECT_USER_SQL
             # return {
             #     "id": row[0],
             #     "username": row[1],
             #     "email": row[2],
-            #     "additional_data": user_data,
+            #     "additional_data": row[3] or {},
             #     "status": row[4],
             #     "created_at": row[5].isoformat() if row[5] else None,
             #     "updated_at": row[6].isoformat() if row[6] else None
@@ -327,59 +595,37 @@ def get_user_by_id(user_id: int):
 # ...existing code...
 
 @app.put("/users/{user_id}")
-def update_user(user_id: int, user_data: UserUpdate):
+async def update_user(user_id: int, user_data: UserUpdate):
     """
     Atualizar dados do usuário.
     """
-    engine = get_database_engine()
-    
     try:
-        with engine.connect() as connection:
-            # Verificar se usuário existe
-            check_sql = "SELECT COUNT(*) FROM users WHERE id = :user_id"
-            result = connection.execute(text(check_sql), {"user_id": user_id})
-            if result.fetchone()[0] == 0:
+        if user_data.username is None and user_data.email is None and user_data.status is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Nenhum campo fornecido para atualização."
+            )
+        
+        async with _engine.connect() as connection:
+            # Executar atualização (RETURNING vazio indica usuário inexistente)
+            result = await connection.execute(
+                UPDATE_USER_SQL,
+                {
+                    "user_id": user_id,
+                    "username": user_data.username,
+                    "email": user_data.email,
+                    "status": user_data.status
+                }
+            )
+            row = result.fetchone()
+            
+            if not row:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Usuário com ID {user_id} não encontrado."
                 )
             
-            # Preparar campos para atualização
-            update_fields = []
-            params = {"user_id": user_id}
-            
-            if user_data.username is not None:
-                update_fields.append("username = :username")
-                params["username"] = user_data.username
-            
-            if user_data.email is not None:
-                update_fields.append("email = :email")
-                params["email"] = user_data.email
-            
-            if user_data.status is not None:
-                update_fields.append("status = :status")
-                params["status"] = user_data.status
-            
-            if not update_fields:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Nenhum campo fornecido para atualização."
-                )
-            
-            # Adicionar timestamp de atualização
-            update_fields.append("updated_at = CURRENT_TIMESTAMP")
-            
-            # Executar atualização
-            update_sql = f"""
-                UPDATE users 
-                SET {', '.join(update_fields)}
-                WHERE id = :user_id
-                RETURNING id, username, email, status, updated_at
-            """
-            
-            result = connection.execute(text(update_sql), params)
-            row = result.fetchone()
-            connection.commit()
+            await connection.commit()
             
             return {
                 "message": f"Usuário ID {user_id} atualizado com sucesso!",
@@ -406,23 +652,14 @@ def update_user(user_id: int, user_data: UserUpdate):
         )
 
 @app.delete("/users/{user_id}")
-def delete_user(user_id: int):
+async def delete_user(user_id: int):
     """
     Deletar usuário por ID (soft delete - marca como inativo).
     """
-    engine = get_database_engine()
-    
     try:
-        with engine.connect() as connection:
+        async with _engine.connect() as connection:
             # Soft delete - apenas marcar como inativo
-            update_sql = """
-                UPDATE users 
-                SET status = 'deleted', updated_at = CURRENT_TIMESTAMP
-                WHERE id = :user_id AND status != 'deleted'
-                RETURNING id, username, email
-            """
-            
-            result = connection.execute(text(update_sql), {"user_id": user_id})
+            result = await connection.execute(SOFT_DELETE_USER_SQL, {"user_id": user_id})
             row = result.fetchone()
             
             if not row:
@@ -431,7 +668,7 @@ def delete_user(user_id: int):
                     detail=f"Usuário com ID {user_id} não encontrado ou já deletado."
                 )
             
-            connection.commit()
+            await connection.commit()
             
             return {
                 "message": f"Usuário '{row[1]}' marcado como deletado!",
@@ -451,20 +688,17 @@ def delete_user(user_id: int):
         )
 
 @app.get("/health")
-def health_check():
+async def health_check(request: Request):
     """
     Endpoint para verificar saúde da aplicação e conexão com DB.
     """
+    db_version = getattr(request.app.state, "db_version", "unknown")
     try:
-        engine = get_database_engine()
-        with engine.connect() as connection:
-            result = connection.execute(text("SELECT 1, version()"))
-            row = result.fetchone()
+        async with _engine.connect() as connection:
+            await connection.execute(HEALTH_CHECK_SQL)
             db_status = "connected"
-            db_version = row[1] if row else "unknown"
     except Exception as e:
         db_status = f"error: {str(e)}"
-        db_version = "unknown"
     
     return {
         "status": "healthy",